@@ -1,20 +1,382 @@
 import os
+import posixpath
+import json
+import shutil
+import hashlib
+import time
+import random
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import joblib
 import mlflow
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+from mlflow.tracking import MlflowClient
+from mlflow.store.artifact.artifact_repository_registry import get_artifact_repository
 
 MLFLOW_TRACKING_URI = "http://136.112.255.152:5000/"
 MODEL_NAME = "iris-random-forest"
 
 LOCAL_MODEL_DIR = "downloaded_models"
 LOCAL_MODEL_PATH = os.path.join(LOCAL_MODEL_DIR, "model.pkl")
+LOCAL_ARTIFACT_DIR = os.path.join(LOCAL_MODEL_DIR, "model")
+VERSION_FILE = os.path.join(LOCAL_MODEL_DIR, "latest_version.json")
+VERSION_CACHE_FILE = os.path.join(LOCAL_MODEL_DIR, "latest_version_cache.json")
+VERSION_CACHE_TTL = float(os.environ.get("MLFLOW_VERSION_CACHE_TTL", "60"))
+
+MAX_DOWNLOAD_WORKERS = 8
+RANGE_CHUNKS = 8
+RANGE_MIN_SIZE = 8 * 1024 * 1024
+
+RETRIES = 5
+RETRY_BASE = 0.5
+RETRY_CAP = 10.0
+RETRY_JITTER = 0.5
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Credential/transport errors raised by the optional cloud storage SDKs
+# (boto3, google-cloud-storage, azure-storage-blob), matched by class name
+# so those packages needn't be importable here
+STORE_ACCESS_ERROR_NAMES = {
+    "NoCredentialsError",
+    "PartialCredentialsError",
+    "EndpointConnectionError",
+    "DefaultCredentialsError",
+    "ClientAuthenticationError",
+    "CredentialUnavailableError",
+}
 
 os.makedirs(LOCAL_MODEL_DIR, exist_ok=True)
 
-def load_latest_model():
+# Shared keep-alive session for the REST fallback, so repeated requests
+# reuse pooled connections instead of opening a new one each time. The pool
+# holds one connection per concurrent range request.
+SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=10, pool_maxsize=MAX_DOWNLOAD_WORKERS * RANGE_CHUNKS
+)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+
+# One client for the whole script so the registry lookups share MLflow's
+# pooled session. The URI is passed explicitly so importing this module
+# doesn't change the global tracking URI.
+CLIENT = MlflowClient(tracking_uri=MLFLOW_TRACKING_URI)
+
+
+def _read_version_cache():
+    """Return the cached (version, run_id, source) if it is younger than the TTL."""
+    try:
+        if time.time() - os.path.getmtime(VERSION_CACHE_FILE) >= VERSION_CACHE_TTL:
+            return None
+        with open(VERSION_CACHE_FILE) as f:
+            cached = json.load(f)
+        return cached["version"], cached["run_id"], cached["source"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def is_transient(exc):
+    """Return True for network errors worth retrying."""
+    if isinstance(exc, (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        # A connection dropped mid-body: requests raises ChunkedEncodingError
+        # from iter_content, raw reads surface urllib3's own errors
+        requests.exceptions.ChunkedEncodingError,
+        ProtocolError,
+        ReadTimeoutError,
+    )):
+        return True
+    if isinstance(exc, requests.exceptions.HTTPError) and exc.response is not None:
+        return exc.response.status_code in TRANSIENT_STATUS_CODES
+    return False
+
+
+def _retry_after(exc):
+    """Seconds requested by a 429 Retry-After header, if present."""
+    response = getattr(exc, "response", None)
+    if response is None or response.status_code != 429:
+        return None
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def retry(func, retries=RETRIES, base=RETRY_BASE, cap=RETRY_CAP):
+    """Call func(), retrying transient errors with jittered exponential backoff.
+
+    Non-transient errors are raised immediately.
+    """
+    for attempt in range(retries):
+        try:
+            return func()
+        except Exception as e:
+            if attempt == retries - 1 or not is_transient(e):
+                raise
+            delay = _retry_after(e)
+            if delay is None:
+                delay = min(cap, base * 2 ** attempt) + random.uniform(0, RETRY_JITTER)
+            else:
+                # Never let a server-supplied Retry-After stall the job indefinitely
+                delay = min(cap, delay)
+            print(f"Transient error ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def can_fall_back_to_rest(exc):
+    """Return True if a direct-download error is one the REST proxy avoids.
+
+    That is: the artifact store's SDK isn't installed, there are no
+    credentials for it, or it can't be reached. Anything else (missing
+    files, permission errors, bugs) should surface as-is.
+    """
+    if isinstance(exc, (
+        ImportError,
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+    )):
+        return True
+    return any(cls.__name__ in STORE_ACCESS_ERROR_NAMES for cls in type(exc).__mro__)
+
+
+def get_latest_version(client):
+    """Return (version, run_id, source) of the newest registered model version.
+
+    source is the storage URI of the version's artifacts, as resolved by the
+    registry, so it is correct whether the model was logged under a run or
+    as a standalone logged model.
+
+    Results are cached on disk for VERSION_CACHE_TTL seconds so repeated
+    runs skip the registry round-trip.
+    """
+    cached = _read_version_cache()
+    if cached is not None:
+        return cached
+
+    versions = client.search_model_versions(f"name='{MODEL_NAME}'")
+    if not versions:
+        raise RuntimeError(f"No versions found for model '{MODEL_NAME}'")
+    latest = max(versions, key=lambda v: int(v.version))
+    source = client.get_model_version_download_uri(MODEL_NAME, latest.version)
+
+    with open(VERSION_CACHE_FILE, "w") as f:
+        json.dump(
+            {"version": latest.version, "run_id": latest.run_id, "source": source}, f
+        )
+    return latest.version, latest.run_id, source
+
+
+def list_artifact_files(repo, path=None):
+    """Recursively map every file path under an artifact directory to its size."""
+    files = {}
+    for info in repo.list_artifacts(path):
+        if info.is_dir:
+            files.update(list_artifact_files(repo, info.path))
+        else:
+            files[info.path] = info.file_size
+    return files
+
+
+def _run_relative_path(source, run_id):
+    """Path of source inside its run's artifacts, or None if not run-scoped."""
+    if source.startswith("runs:/"):
+        return source[len("runs:/"):].partition("/")[2]
+    marker = f"{run_id}/artifacts/"
+    if run_id and marker in source:
+        return source.split(marker, 1)[1]
+    return None
+
+
+def _fetch_whole(url, params, out_path):
+    """Stream a file to disk over a single connection with a bounded buffer."""
+    with SESSION.get(url, params=params, stream=True, timeout=20) as r:
+        r.raise_for_status()
+        r.raw.decode_content = True
+        with open(out_path, "wb") as f:
+            shutil.copyfileobj(r.raw, f, length=1024 * 1024)
+
+
+class RangeNotSupported(RuntimeError):
+    """The server did not honour a byte-range request."""
+
+
+def _fetch_range(url, params, out_path, start, end):
+    """Download bytes [start, end] of a file and write them at their offset."""
+    headers = {"Range": f"bytes={start}-{end}"}
+    with SESSION.get(url, params=params, headers=headers, stream=True, timeout=20) as r:
+        r.raise_for_status()
+        content_range = r.headers.get("Content-Range", "")
+        if r.status_code != 206 or not content_range.startswith(f"bytes {start}-{end}/"):
+            raise RangeNotSupported(f"Server ignored Range request for {out_path}")
+
+        written = 0
+        with open(out_path, "r+b") as f:
+            f.seek(start)
+            for chunk in r.iter_content(chunk_size=1024 * 1024):
+                f.write(chunk)
+                written += len(chunk)
+
+    # A short body means the connection dropped mid-range, which is retryable
+    if written != end - start + 1:
+        raise requests.exceptions.ConnectionError(
+            f"Range {start}-{end} of {out_path}: got {written} bytes"
+        )
+
+
+def _fetch_ranges(url, params, out_path, size):
+    """Download a file as RANGE_CHUNKS byte ranges on parallel connections."""
+    # Preallocate so every range worker can write at its own offset
+    with open(out_path, "wb") as f:
+        f.truncate(size)
+
+    def _fetch_one(byte_range):
+        start, end = byte_range
+        retry(functools.partial(_fetch_range, url, params, out_path, start, end))
+
+    step = -(-size // RANGE_CHUNKS)
+    ranges = [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+    with ThreadPoolExecutor(max_workers=RANGE_CHUNKS) as ex:
+        list(ex.map(_fetch_one, ranges))
+
+
+def _download_rest(run_id, path, out_path):
+    """Fetch one run artifact file through the tracking server's artifact proxy.
+
+    Large files are split into byte ranges fetched on parallel connections;
+    small files, or servers that don't honour Range, use a single request.
+    """
+    url = f"{MLFLOW_TRACKING_URI.rstrip('/')}/get-artifact"
+    params = {"path": path, "run_uuid": run_id}
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+
+    def _head():
+        r = SESSION.head(url, params=params, timeout=20, allow_redirects=True)
+        r.raise_for_status()
+        return r
+
+    head = retry(_head)
+    size = int(head.headers.get("Content-Length", 0))
+
+    if head.headers.get("Accept-Ranges") != "bytes" or size < RANGE_MIN_SIZE:
+        retry(lambda: _fetch_whole(url, params, out_path))
+        return out_path
+
+    try:
+        try:
+            _fetch_ranges(url, params, out_path, size)
+        except RangeNotSupported as e:
+            # _fetch_whole rewrites the preallocated file from scratch
+            print(f"{e}; downloading {path} over a single connection")
+            retry(lambda: _fetch_whole(url, params, out_path))
+    except Exception:
+        # Don't leave a partially filled preallocated file behind
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        raise
+
+    return out_path
+
+
+def _hash_dir(root):
+    """Return (sha256, total_size) over every file under root, in path order."""
+    h = hashlib.sha256()
+    size = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            full = os.path.join(dirpath, name)
+            h.update(os.path.relpath(full, root).encode())
+            with open(full, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    h.update(chunk)
+                    size += len(chunk)
+    return h.hexdigest(), size
+
+
+def is_already_downloaded(version):
+    """Check the local copy matches the recorded version, hash and size."""
+    if not os.path.isdir(LOCAL_ARTIFACT_DIR):
+        return False
+    try:
+        with open(VERSION_FILE) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    if meta.get("version") != str(version):
+        return False
+    sha256, size = _hash_dir(LOCAL_ARTIFACT_DIR)
+    return meta.get("sha256") == sha256 and meta.get("size") == size
+
+
+def write_version_file(version):
+    """Record the version, hash and size of the downloaded artifact files."""
+    sha256, size = _hash_dir(LOCAL_ARTIFACT_DIR)
+    with open(VERSION_FILE, "w") as f:
+        json.dump({"version": str(version), "sha256": sha256, "size": size}, f)
+
+
+def download_artifacts(source, run_id):
+    """Download the model artifact files concurrently, one request per file."""
+    repo = get_artifact_repository(source)
+    file_sizes = list_artifact_files(repo)
+    if not file_sizes:
+        raise RuntimeError(f"No artifact files found at {source}")
+    run_path = _run_relative_path(source, run_id)
+
+    # Start from a clean directory so files from an older version can't linger
+    shutil.rmtree(LOCAL_ARTIFACT_DIR, ignore_errors=True)
+    print(f"Downloading {len(file_sizes)} artifact files ...")
+
+    def _download(path):
+        try:
+            return repo.download_artifacts(path, dst_path=LOCAL_ARTIFACT_DIR)
+        except Exception as e:
+            # The REST proxy addresses files by run, so it only helps for
+            # versions whose artifacts live inside a run
+            if run_path is None or not can_fall_back_to_rest(e):
+                raise
+            print(f"Direct download of {path} failed ({e}); falling back to REST")
+            return _download_rest(
+                run_id,
+                posixpath.join(run_path, path),
+                os.path.join(LOCAL_ARTIFACT_DIR, path)
+            )
+
+    with ThreadPoolExecutor(max_workers=MAX_DOWNLOAD_WORKERS) as ex:
+        list(ex.map(_download, file_sizes))
+
+    # Check against the sizes the server listed before anything is recorded
+    # as a good download
+    for path, expected in file_sizes.items():
+        actual = os.path.getsize(os.path.join(LOCAL_ARTIFACT_DIR, path))
+        if expected is not None and actual != expected:
+            raise RuntimeError(
+                f"Size mismatch for {path}: expected {expected} bytes, got {actual}"
+            )
+
+    return LOCAL_ARTIFACT_DIR
+
+
+def load_latest_model(client=CLIENT):
+    # Artifact repositories (e.g. mlflow-artifacts:/ URIs) resolve the
+    # server from the global tracking URI
     mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
-    model_uri = f"models:/{MODEL_NAME}/latest"
 
-    model = mlflow.sklearn.load_model(model_uri)
+    version, run_id, source = get_latest_version(client)
+    print(f"Latest version of {MODEL_NAME}: {version} (run {run_id})")
+
+    if is_already_downloaded(version):
+        print(f"Version {version} already downloaded and verified, skipping download")
+        local_artifact_dir = LOCAL_ARTIFACT_DIR
+    else:
+        local_artifact_dir = download_artifacts(source, run_id)
+        write_version_file(version)
+
+    model = mlflow.sklearn.load_model(local_artifact_dir)
     joblib.dump(model, LOCAL_MODEL_PATH)
 
     print(f"Model downloaded to {LOCAL_MODEL_PATH}")
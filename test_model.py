@@ -1,21 +1,33 @@
 import unittest
+from unittest import mock
 import pandas as pd
 import os
+import json
+import time
+import tempfile
+import numpy as np
+import requests
+from urllib3.exceptions import ProtocolError
+
+import fetch_from_mlflow
+import train
+from train import add_label_noise
 
 
 class TestData(unittest.TestCase):
 
     data_path = './data.csv'
 
-    def setUp(self):
-        """Load dataset only"""
+    @classmethod
+    def setUpClass(cls):
+        """Load dataset once for all tests in the class"""
         try:
-            if not os.path.exists(self.data_path):
+            if not os.path.exists(cls.data_path):
                 raise FileNotFoundError("data.csv not found.")
-            self.input_data = pd.read_csv(self.data_path)
+            cls.input_data = pd.read_csv(cls.data_path)
         except Exception as e:
             print(f"Setup failed: {e}")
-            self.input_data = None
+            cls.input_data = None
 
     def test_data_integrity_check(self):
         """Ensure required columns exist in the dataset"""
@@ -35,5 +47,331 @@ class TestData(unittest.TestCase):
         self.assertTrue(features_present, "Required features missing from data")
 
 
+class TestLabelNoise(unittest.TestCase):
+
+    labels = np.array(["setosa", "versicolor", "virginica"] * 40)
+
+    def test_flips_exactly_k_labels(self):
+        """Exactly floor(noise_frac * n) labels change, each to a different class"""
+        noisy = add_label_noise(self.labels, 0.1, random_state=123)
+
+        changed = noisy != self.labels
+        self.assertEqual(changed.sum(), int(np.floor(0.1 * len(self.labels))))
+        self.assertTrue(set(noisy) <= set(self.labels))
+
+    def test_zero_noise_returns_unchanged_copy(self):
+        """noise_frac=0 returns an equal copy, not the input array"""
+        noisy = add_label_noise(self.labels, 0.0, random_state=123)
+
+        np.testing.assert_array_equal(noisy, self.labels)
+        self.assertIsNot(noisy, self.labels)
+
+
+def _http_error(status_code, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    return requests.exceptions.HTTPError(response=response)
+
+
+class TestRetry(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch("time.sleep")
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_is_transient(self):
+        """Only network errors and retryable HTTP statuses are transient"""
+        self.assertTrue(fetch_from_mlflow.is_transient(requests.exceptions.ConnectionError()))
+        self.assertTrue(fetch_from_mlflow.is_transient(requests.exceptions.Timeout()))
+        self.assertTrue(fetch_from_mlflow.is_transient(_http_error(503)))
+        self.assertFalse(fetch_from_mlflow.is_transient(_http_error(404)))
+        self.assertFalse(fetch_from_mlflow.is_transient(AttributeError()))
+
+    def test_truncated_body_is_retried(self):
+        """A connection dropped mid-download is retried"""
+        func = mock.Mock(side_effect=[
+            requests.exceptions.ChunkedEncodingError("IncompleteRead"),
+            ProtocolError("Connection broken"),
+            "ok",
+        ])
+
+        self.assertEqual(fetch_from_mlflow.retry(func), "ok")
+        self.assertEqual(func.call_count, 3)
+
+    def test_non_transient_error_raises_immediately(self):
+        """Programming errors are not retried"""
+        func = mock.Mock(side_effect=AttributeError("boom"))
+
+        with self.assertRaises(AttributeError):
+            fetch_from_mlflow.retry(func)
+
+        self.assertEqual(func.call_count, 1)
+        self.sleep.assert_not_called()
+
+    def test_retries_503_until_success(self):
+        """Transient server errors are retried with backoff"""
+        func = mock.Mock(side_effect=[_http_error(503), _http_error(503), "ok"])
+
+        self.assertEqual(fetch_from_mlflow.retry(func), "ok")
+        self.assertEqual(func.call_count, 3)
+        self.assertEqual(self.sleep.call_count, 2)
+
+    def test_gives_up_after_retries(self):
+        """The last transient error is re-raised once retries run out"""
+        func = mock.Mock(side_effect=_http_error(503))
+
+        with self.assertRaises(requests.exceptions.HTTPError):
+            fetch_from_mlflow.retry(func, retries=3)
+
+        self.assertEqual(func.call_count, 3)
+
+    def test_honors_retry_after_on_429(self):
+        """A 429 waits for the server's Retry-After"""
+        func = mock.Mock(side_effect=[_http_error(429, {"Retry-After": "3"}), "ok"])
+
+        self.assertEqual(fetch_from_mlflow.retry(func), "ok")
+        self.sleep.assert_called_once_with(3.0)
+
+    def test_retry_after_is_capped(self):
+        """An oversized Retry-After is capped instead of blocking for it"""
+        func = mock.Mock(side_effect=[_http_error(429, {"Retry-After": "3600"}), "ok"])
+
+        fetch_from_mlflow.retry(func, cap=10.0)
+        self.sleep.assert_called_once_with(10.0)
+
+
+class TestRestFallback(unittest.TestCase):
+
+    def test_store_access_errors_fall_back(self):
+        """Missing SDKs, credentials or connectivity trigger the REST fallback"""
+        NoCredentialsError = type("NoCredentialsError", (Exception,), {})
+
+        self.assertTrue(fetch_from_mlflow.can_fall_back_to_rest(ImportError("boto3")))
+        self.assertTrue(fetch_from_mlflow.can_fall_back_to_rest(NoCredentialsError()))
+        self.assertTrue(fetch_from_mlflow.can_fall_back_to_rest(
+            requests.exceptions.ConnectionError()
+        ))
+
+    def test_other_errors_do_not_fall_back(self):
+        """Real failures and bugs are not rerouted"""
+        self.assertFalse(fetch_from_mlflow.can_fall_back_to_rest(AttributeError()))
+        self.assertFalse(fetch_from_mlflow.can_fall_back_to_rest(PermissionError()))
+        self.assertFalse(fetch_from_mlflow.can_fall_back_to_rest(RuntimeError("404")))
+
+
+def _temp_dir(test):
+    tmp = tempfile.TemporaryDirectory()
+    test.addCleanup(tmp.cleanup)
+    return tmp.name
+
+
+def _patch(test, target, name, value):
+    patcher = mock.patch.object(target, name, value)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+
+class TestDownloadCache(unittest.TestCase):
+
+    def setUp(self):
+        tmp = _temp_dir(self)
+        self.model_file = os.path.join(tmp, "model", "model.pkl")
+        os.makedirs(os.path.dirname(self.model_file))
+        with open(self.model_file, "wb") as f:
+            f.write(b"weights")
+
+        _patch(self, fetch_from_mlflow, "LOCAL_ARTIFACT_DIR", os.path.dirname(self.model_file))
+        _patch(self, fetch_from_mlflow, "VERSION_FILE", os.path.join(tmp, "latest_version.json"))
+        fetch_from_mlflow.write_version_file("3")
+
+    def test_matching_copy_is_reused(self):
+        """An unchanged copy of the recorded version counts as downloaded"""
+        self.assertTrue(fetch_from_mlflow.is_already_downloaded("3"))
+
+    def test_new_version_is_downloaded(self):
+        """A different registry version invalidates the copy"""
+        self.assertFalse(fetch_from_mlflow.is_already_downloaded("4"))
+
+    def test_modified_file_is_downloaded(self):
+        """Same-size content changes are caught by the hash"""
+        with open(self.model_file, "wb") as f:
+            f.write(b"WEIGHTS")
+        self.assertFalse(fetch_from_mlflow.is_already_downloaded("3"))
+
+    def test_truncated_file_is_downloaded(self):
+        """A partially written file is caught"""
+        with open(self.model_file, "wb") as f:
+            f.write(b"wei")
+        self.assertFalse(fetch_from_mlflow.is_already_downloaded("3"))
+
+    def test_missing_sidecar_is_downloaded(self):
+        """Without a sidecar nothing is trusted"""
+        os.remove(fetch_from_mlflow.VERSION_FILE)
+        self.assertFalse(fetch_from_mlflow.is_already_downloaded("3"))
+
+
+class TestVersionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_file = os.path.join(_temp_dir(self), "latest_version_cache.json")
+        _patch(self, fetch_from_mlflow, "VERSION_CACHE_FILE", self.cache_file)
+        _patch(self, fetch_from_mlflow, "VERSION_CACHE_TTL", 60.0)
+
+    def _write_cache(self, entry, age=0):
+        with open(self.cache_file, "w") as f:
+            json.dump(entry, f)
+        mtime = time.time() - age
+        os.utime(self.cache_file, (mtime, mtime))
+
+    def test_fresh_cache_skips_registry(self):
+        """A cache younger than the TTL is returned without a registry call"""
+        self._write_cache({"version": "3", "run_id": "abc", "source": "runs:/abc/model"})
+        client = mock.Mock()
+
+        self.assertEqual(
+            fetch_from_mlflow.get_latest_version(client), ("3", "abc", "runs:/abc/model")
+        )
+        client.search_model_versions.assert_not_called()
+
+    def test_expired_cache_is_ignored(self):
+        """A cache older than the TTL is a miss"""
+        self._write_cache({"version": "3", "run_id": "abc", "source": "s"}, age=120)
+        self.assertIsNone(fetch_from_mlflow._read_version_cache())
+
+    def test_old_format_cache_is_ignored(self):
+        """A cache written before source was recorded is a miss"""
+        self._write_cache({"version": "3", "run_id": "abc"})
+        self.assertIsNone(fetch_from_mlflow._read_version_cache())
+
+    def test_missing_cache_is_ignored(self):
+        """No cache file is a miss"""
+        self.assertIsNone(fetch_from_mlflow._read_version_cache())
+
+
+class TestLoadDataset(unittest.TestCase):
+
+    df = pd.DataFrame({"sepal_length": [5.1, 4.9], "species": ["setosa", "virginica"]})
+
+    def setUp(self):
+        tmp = _temp_dir(self)
+        self.csv_path = os.path.join(tmp, "data.csv")
+        self.parquet_path = os.path.join(tmp, "data.parquet")
+        _patch(self, train, "DATA_CSV_PATH", self.csv_path)
+        _patch(self, train, "DATA_PARQUET_PATH", self.parquet_path)
+        self.df.to_csv(self.csv_path, index=False)
+
+    def _write_parquet(self, content, age):
+        with open(self.parquet_path, "wb") as f:
+            f.write(content)
+        mtime = os.path.getmtime(self.csv_path) + age
+        os.utime(self.parquet_path, (mtime, mtime))
+
+    def test_stale_parquet_is_ignored(self):
+        """A Parquet copy older than the CSV is not read"""
+        self._write_parquet(b"old", age=-60)
+
+        with mock.patch("pandas.read_parquet") as read_parquet:
+            loaded = train.load_dataset()
+
+        read_parquet.assert_not_called()
+        pd.testing.assert_frame_equal(loaded, self.df)
+
+    def test_unreadable_parquet_falls_back_to_csv(self):
+        """A corrupt Parquet copy falls back to the CSV"""
+        self._write_parquet(b"not parquet", age=60)
+
+        pd.testing.assert_frame_equal(train.load_dataset(), self.df)
+
+    def test_parquet_used_without_csv(self):
+        """A current Parquet copy is used even if the CSV is missing"""
+        self._write_parquet(b"", age=60)
+        os.remove(self.csv_path)
+
+        with mock.patch("pandas.read_parquet", return_value=self.df):
+            pd.testing.assert_frame_equal(train.load_dataset(), self.df)
+
+
+class TestSplitCache(unittest.TestCase):
+
+    df = pd.DataFrame({"species": ["setosa", "versicolor", "virginica"] * 10})
+
+    def setUp(self):
+        # split_indices writes its cache to the working directory
+        cwd = os.getcwd()
+        os.chdir(_temp_dir(self))
+        self.addCleanup(os.chdir, cwd)
+        self.y = self.df["species"].values
+
+    def _cache_files(self):
+        return [name for name in os.listdir(".") if name.startswith(".split_cache_")]
+
+    def test_cache_hit_skips_split(self):
+        """A second call loads the cached indices instead of re-splitting"""
+        train_idx, test_idx = train.split_indices(self.df, self.y)
+
+        with mock.patch.object(train, "train_test_split") as split:
+            cached_train, cached_test = train.split_indices(self.df, self.y)
+
+        split.assert_not_called()
+        np.testing.assert_array_equal(cached_train, train_idx)
+        np.testing.assert_array_equal(cached_test, test_idx)
+
+    def test_corrupt_cache_is_recomputed(self):
+        """An unreadable cache file is rebuilt instead of crashing"""
+        train_idx, test_idx = train.split_indices(self.df, self.y)
+        (cache_file,) = self._cache_files()
+        with open(cache_file, "wb") as f:
+            f.write(b"half-written")
+
+        new_train, new_test = train.split_indices(self.df, self.y)
+
+        np.testing.assert_array_equal(new_train, train_idx)
+        np.testing.assert_array_equal(new_test, test_idx)
+        with np.load(cache_file) as cached:
+            np.testing.assert_array_equal(cached["train"], train_idx)
+
+    def test_no_temp_files_left_behind(self):
+        """The atomic write leaves only the final cache file"""
+        train.split_indices(self.df, self.y)
+        self.assertEqual(len(os.listdir(".")), 1)
+
+
+class TestFetchRanges(unittest.TestCase):
+
+    data = bytes(range(10))
+
+    def setUp(self):
+        self.out_path = os.path.join(_temp_dir(self), "model.pkl")
+        self.ranges = []
+
+    def _fake_fetch_range(self, url, params, out_path, start, end):
+        self.ranges.append((start, end))
+        with open(out_path, "r+b") as f:
+            f.seek(start)
+            f.write(self.data[start:end + 1])
+
+    def test_ranges_cover_file_exactly(self):
+        """Ranges are contiguous, non-overlapping and land at their offsets"""
+        _patch(self, fetch_from_mlflow, "RANGE_CHUNKS", 3)
+        _patch(self, fetch_from_mlflow, "_fetch_range", self._fake_fetch_range)
+
+        fetch_from_mlflow._fetch_ranges("url", {}, self.out_path, len(self.data))
+
+        self.assertEqual(sorted(self.ranges), [(0, 3), (4, 7), (8, 9)])
+        with open(self.out_path, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_more_chunks_than_bytes(self):
+        """Tiny files still get one valid range per byte"""
+        _patch(self, fetch_from_mlflow, "RANGE_CHUNKS", 16)
+        _patch(self, fetch_from_mlflow, "_fetch_range", self._fake_fetch_range)
+
+        fetch_from_mlflow._fetch_ranges("url", {}, self.out_path, 4)
+
+        self.assertEqual(sorted(self.ranges), [(0, 0), (1, 1), (2, 2), (3, 3)])
+
+
 if __name__ == '__main__':
     unittest.main()